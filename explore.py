@@ -1,4 +1,9 @@
+import numpy as np
 import pandas as pd
+from scipy import sparse
+
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import HashingVectorizer
 
 def check_non_keywords(df):
     """ Check value counts of words I did not designate as keywords in car specs column """
@@ -11,4 +16,115 @@ def check_non_keywords(df):
                     ).split()        # join all lists into one string, then split the string into a list of each word
         ).value_counts()        # calculate the value counts of each word in the series
         .head(25)         # display the top 25 keywords
-    )
\ No newline at end of file
+    )
+
+# --------------------- Keyword Clustering --------------------- #
+
+class KeywordClusters:
+    """ 
+        Cluster specs tokens against horsepower gained over stock (hp - stock_hp).
+        Tokens and n-grams are hashed into a fixed-width sparse matrix, so memory
+        stays bounded no matter how many runs are fed in. Each token's count and
+        running hp-gain sums are accumulated chunk by chunk, and MiniBatchKMeans
+        is updated with partial_fit on the tokens each new chunk touches.
+    """
+    def __init__(self, n_clusters=8, ngram_range=(1,2), n_features=2**18, min_count=5, random_state=1):
+        # stateless vectorizer: no vocabulary to grow, never densified
+        self.vectorizer = HashingVectorizer(ngram_range=ngram_range, n_features=n_features,
+                                            binary=True, norm=None, alternate_sign=False,
+                                            token_pattern=r'(?u)\b\w[\w.\-]*\b')
+        # same hashing applied to already-analyzed tokens, one column per token
+        self.token_hasher = HashingVectorizer(analyzer=single_token, n_features=n_features,
+                                              binary=True, norm=None, alternate_sign=False)
+        self.kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state)
+        self.min_count = min_count
+        # running per-token accumulators
+        self.counts = np.zeros(n_features)
+        self.gain_sums = np.zeros(n_features)
+        # one readable token per hashed column, for naming keyword groups
+        self.tokens = {}
+        self.fitted = False
+
+    def update(self, info):
+        """ Add a chunk of runs (needs 'specs', 'hp', and 'stock_hp') and update clusters """
+        # runs missing hp or stock_hp have no gain, keep them out of every accumulator
+        info = info[info.hp.notna() & info.stock_hp.notna()]
+        specs = info.specs.fillna('')
+        gain = (info.hp - info.stock_hp).to_numpy(dtype='float')
+        X = self.vectorizer.transform(specs) # sparse runs x hashed tokens
+        # accumulate token counts and hp gain sums without densifying X
+        chunk_counts = np.asarray(X.sum(axis=0)).ravel()
+        self.counts += chunk_counts
+        self.gain_sums += X.T @ gain
+        # remember a readable token for each newly seen column,
+        # analyzing only the specs that contain a new column
+        seen = np.unique(X.indices)
+        new = np.array([col for col in seen if int(col) not in self.tokens], dtype='int')
+        if len(new):
+            analyzer = self.vectorizer.build_analyzer()
+            new_rows = np.unique(X[:, new].nonzero()[0])
+            tokens = list(set(token for spec in specs.iloc[new_rows] for token in analyzer(spec)))
+            for column, token in zip(self.token_hasher.transform(tokens).indices, tokens):
+                self.tokens.setdefault(int(column), token)
+        # move clusters toward the updated profiles of tokens touched by this chunk,
+        # weighted by this chunk's counts so earlier runs aren't counted again
+        touched = seen[self.counts[seen] >= self.min_count]
+        if len(touched) >= self.kmeans.n_clusters or (self.fitted and len(touched)):
+            self.kmeans.partial_fit(self.profiles(touched), sample_weight=chunk_counts[touched])
+            self.fitted = True
+
+        return self
+
+    def profiles(self, columns):
+        """ Return each token's mean hp gain (in 100s of hp) and log10 count """
+        counts = self.counts[columns]
+        return np.column_stack([self.gain_sums[columns] / counts / 100, np.log10(counts)])
+
+    def token_clusters(self):
+        """ 
+            Return a dataframe of each common token, its count, mean hp gain, and cluster.
+            Empty until enough tokens reach min_count to fit the clusters.
+        """
+        columns = np.flatnonzero(self.counts >= self.min_count)
+        if not self.fitted:
+            columns = columns[:0]
+        return pd.DataFrame({
+            'column': columns,
+            'token': [self.tokens.get(int(col)) for col in columns],
+            'count': self.counts[columns].astype('int'),
+            'mean_hp_gain': self.gain_sums[columns] / self.counts[columns],
+            'cluster': self.kmeans.predict(self.profiles(columns)) if len(columns) else np.array([], dtype='int')
+        }).sort_values(['cluster', 'count'], ascending=[True, False]).reset_index(drop=True)
+
+    def transform(self, info):
+        """ 
+            Return a dataframe counting each run's specs tokens in each keyword cluster.
+            All counts are zero until the clusters are fitted.
+        """
+        X = self.vectorizer.transform(info.specs.fillna(''))
+        groups = self.token_clusters()
+        # sparse token -> cluster assignment matrix
+        rows, cols = groups.column.astype('int'), groups.cluster.astype('int')
+        assign = sparse.csr_matrix((np.ones(len(groups)), (rows, cols)),
+                                   shape=(X.shape[1], self.kmeans.n_clusters))
+        # runs x clusters, small enough to return dense
+        return pd.DataFrame((X @ assign).toarray(), index=info.index,
+                            columns=['kw_cluster_' + str(i) for i in range(self.kmeans.n_clusters)])
+
+def single_token(token):
+    """ Analyzer for already-tokenized text (module-level so KeywordClusters pickles) """
+    return [token]
+
+def cluster_keywords(info, clusters=None, chunksize=1000, **kwargs):
+    """ 
+        Feed runs to a KeywordClusters in chunks, return it.
+        Pass an existing KeywordClusters to update it with new runs instead of refitting.
+        Clusters are learned from hp, the model target: only pass train-split runs
+        (e.g. info_train from wrangle.split_runs_and_info).
+    """
+    if clusters is None:
+        clusters = KeywordClusters(**kwargs)
+    for start in range(0, len(info), chunksize):
+        clusters.update(info.iloc[start:start + chunksize])
+
+    return clusters
@@ -1,10 +1,23 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 
 from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor
+from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor, SGDRegressor
 from sklearn.preprocessing import PolynomialFeatures
+from sklearn.pipeline import make_pipeline
+
+import wrangle
+
+# --------------------- Hyperparameters --------------------- #
+
+ALPHA_LIST = [.0001, .001, .01, .1, 1, 10, 100, 1000] # LASSO+LARS and GLM alphas
+POWER_LIST = [0,1,2,3] # GLM (Tweedie) powers
+DEGREE_LIST = [2,3,4,5,6] # Polynomial regression degrees
 
 # --------------------- Model Evaluation Results --------------------- #
 
@@ -44,6 +57,194 @@ def regression_shotgun(X_train, y_train, X_validate, y_validate):
     
     return y_train, y_validate
 
+# --------------------- Successive Halving --------------------- #
+
+def halving_shotgun(X_train, y_train, X_validate, y_validate, min_samples=50, keep=1/3, random_state=1):
+    """ 
+        Run the regression shotgun's OLS, LASSO+LARS, GLM, and Polynomial models
+        as a successive-halving search:
+        Score every candidate on a small random subsample of train,
+        Keep the best fraction (by validate RMSE) and grow the subsample,
+        Repeat until the subsample is the full train split,
+        Push survivors' full-train predictions to the y dataframes, return them
+        alongside a dataframe of each candidate's rung scores.
+        Survivors' predictions can be evaluated with y_df_RMSE_r2.
+    """
+    # Baseline
+    y_train, y_validate = regression_bl(y_train, y_validate)
+    # Candidate models, keyed by the same names regression_shotgun uses
+    candidates = shotgun_candidates()
+    # Shuffle train rows once so each rung's sample contains the previous one
+    X_train = np.asarray(X_train)
+    X_validate = np.asarray(X_validate)
+    order = np.random.RandomState(random_state).permutation(len(X_train))
+    # Grow sample by 1/keep each rung, starting from min_samples
+    sample_size = min(min_samples, len(order))
+    rung = 0
+    history = []
+    while sample_size < len(order) and len(candidates) > 1:
+        sample = order[:sample_size]
+        scores = {}
+        for name, build in candidates.items():
+            try:
+                preds = build().fit(X_train[sample], y_train.actuals.iloc[sample]).predict(X_validate)
+                scores[name] = mean_squared_error(y_validate.actuals, preds) ** 0.5
+            except (ValueError, np.linalg.LinAlgError):
+                scores[name] = np.inf # candidate can't fit this sample, drop it
+            history.append({'Model':name, 'Rung':rung, 'Samples':sample_size, 'Validate_RMSE':scores[name]})
+        # Keep the best fraction of candidates that fit (at least one, if any fit)
+        n_keep = max(1, int(np.ceil(len(candidates) * keep)))
+        survivors = [name for name in sorted(scores, key=scores.get) if np.isfinite(scores[name])][:n_keep]
+        candidates = {name: candidates[name] for name in survivors}
+        # Move survivors to a larger sample
+        sample_size = min(int(np.ceil(sample_size / keep)), len(order))
+        rung += 1
+    # Fit survivors on the full train split, add predictions to y dataframes
+    # (no survivors if every candidate failed, leaving only the baselines)
+    for name, build in candidates.items():
+        try:
+            fitted = build().fit(X_train, y_train.actuals)
+        except (ValueError, np.linalg.LinAlgError):
+            continue # candidate can't fit the full train split, drop it
+        y_train[name] = fitted.predict(X_train)
+        y_validate[name] = fitted.predict(X_validate)
+        history.append({'Model':name, 'Rung':rung, 'Samples':len(order),
+                        'Validate_RMSE':mean_squared_error(y_validate.actuals, y_validate[name]) ** 0.5})
+
+    return y_train, y_validate, pd.DataFrame(history)
+
+def shotgun_candidates():
+    """ Return a dict of model name to unfitted model builder for every regression_shotgun model """
+    candidates = {'ols_preds': lambda: LinearRegression(normalize=True)}
+    # LASSO+LARS models
+    for alpha in ALPHA_LIST:
+        candidates['lars_' + str(alpha) + '_preds'] = lambda alpha=alpha: LassoLars(alpha=alpha)
+    # GLM models
+    for power in POWER_LIST:
+        for alpha in ALPHA_LIST:
+            name = 'glm_' + 'p' + str(power) + 'a' + str(alpha) + '_preds'
+            candidates[name] = lambda power=power, alpha=alpha: TweedieRegressor(power=power, alpha=alpha)
+    # Polynomial regressions
+    for degree in DEGREE_LIST:
+        candidates['lm_pf_' + str(degree) + '_preds'] = lambda degree=degree: \
+            make_pipeline(PolynomialFeatures(degree=degree), LinearRegression(normalize=True))
+
+    return candidates
+
+# --------------------- Segmented Regression --------------------- #
+
+SHARED_ARRAYS = {} # worker-side views into shared feature arrays
+
+def segment_shotgun(X_train, y_train, X_validate, y_validate, seg_train, seg_validate,
+                    level='make', min_rows=50, holdout=.25, max_workers=None):
+    """
+        Fit the regression shotgun models separately for each car segment:
+        level='make' segments on car_make,
+        level='make_model' segments on car_make/car_model, falling back to car_make,
+        Segments with fewer than min_rows train rows fall back to their parent
+        make or the global model,
+        Fit segments on a process pool reading train X/y from shared memory,
+        Pick each segment's best model on a holdout of its own train rows,
+        refit it on all of them, and keep it in a lookup,
+        Push 'segment_preds' to the y dataframes, return them and the lookup.
+        Validate is only used for reporting, so segment_preds validate scores
+        compare fairly with y_df_RMSE_r2 scores for the global models.
+    """
+    # check inputs before allocating any shared memory
+    if not len(X_train) or not len(X_validate):
+        raise ValueError('segment_shotgun: train and validate splits must not be empty')
+    # row indices for each segment big enough to train on, plus the global model
+    jobs = segment_rows(segment_keys(seg_train, level), min_rows)
+    # copy train features and targets into shared memory once, workers attach by name
+    arrays = [np.ascontiguousarray(a, dtype='float64') for a in (X_train, y_train.actuals)]
+    shared = []
+    try:
+        for a in arrays:
+            shared.append(shared_memory.SharedMemory(create=True, size=a.nbytes))
+            np.ndarray(a.shape, dtype=a.dtype, buffer=shared[-1].buf)[:] = a
+        specs = [(shm.name, a.shape) for shm, a in zip(shared, arrays)]
+        with ProcessPoolExecutor(max_workers, initializer=attach_shared, initargs=(specs,)) as pool:
+            # one task per segment, biggest first so stragglers don't hold up the pool
+            keys = sorted(jobs, key=lambda key: len(jobs[key]), reverse=True)
+            futures = {key: pool.submit(fit_segment, key, jobs[key], holdout) for key in keys}
+            lookup = {key: future.result() for key, future in futures.items()}
+    finally:
+        for shm in shared:
+            shm.close()
+            shm.unlink()
+    # predict through the segment lookup
+    y_train['segment_preds'] = segment_predict(lookup, arrays[0], seg_train, level)
+    y_validate['segment_preds'] = segment_predict(lookup, X_validate, seg_validate, level)
+
+    return y_train, y_validate, lookup
+
+def segment_keys(segments, level):
+    """ Return each row's segment keys, most specific first, ending with 'global' """
+    if level not in ['make', 'make_model']:
+        raise ValueError("level must be 'make' or 'make_model'")
+    make = segments.car_make.astype('str').to_numpy()
+    if level == 'make':
+        return [[m, 'global'] for m in make]
+    make_model = (segments.car_make.astype('str') + '/' + segments.car_model.astype('str')).to_numpy()
+    return [[mm, m, 'global'] for mm, m in zip(make_model, make)]
+
+def segment_rows(train_keys, min_rows):
+    """ Return {segment: train row indices} for segments with enough train rows """
+    train_rows = {}
+    for i, row_keys in enumerate(train_keys):
+        for key in row_keys:
+            train_rows.setdefault(key, []).append(i)
+    return {key: np.array(idx) for key, idx in train_rows.items()
+            if key == 'global' or len(idx) >= min_rows}
+
+def attach_shared(specs):
+    """ Pool initializer: map the shared train arrays into this worker """
+    for name, (shm_name, shape) in zip(['X_train','y_train'], specs):
+        shm = shared_memory.SharedMemory(name=shm_name)
+        SHARED_ARRAYS[name + '_shm'] = shm # keep the mapping alive
+        SHARED_ARRAYS[name] = np.ndarray(shape, dtype='float64', buffer=shm.buf)
+
+def fit_segment(key, train_idx, holdout=.25):
+    """
+        Fit every shotgun candidate on part of one segment's train rows,
+        Score them on the held-out rest, refit the best on all rows, return it.
+    """
+    X, y = SHARED_ARRAYS['X_train'][train_idx], SHARED_ARRAYS['y_train'][train_idx]
+    # inner split of the segment's train rows for model selection
+    order = np.random.RandomState(1).permutation(len(train_idx))
+    n_holdout = max(1, int(len(order) * holdout))
+    fit_rows, score_rows = order[n_holdout:], order[:n_holdout]
+    best_build, best_rmse = None, np.inf
+    for name, build in shotgun_candidates().items():
+        try:
+            fitted = build().fit(X[fit_rows], y[fit_rows])
+            rmse = mean_squared_error(y[score_rows], fitted.predict(X[score_rows])) ** 0.5
+        except (ValueError, np.linalg.LinAlgError):
+            continue # candidate can't fit this segment
+        if rmse < best_rmse:
+            best_build, best_rmse = build, rmse
+    # nothing fit, leave the segment to its parent make or 'global'
+    if best_build is None:
+        return None
+    try:
+        return best_build().fit(X, y)
+    except (ValueError, np.linalg.LinAlgError):
+        return None
+
+def segment_predict(lookup, X, segments, level='make'):
+    """ Predict each row with its most specific segment model in the lookup """
+    X = np.asarray(X)
+    preds = np.empty(len(X))
+    # first key of each row that has a trained model
+    chosen = np.array([next(key for key in keys if lookup.get(key) is not None)
+                       for keys in segment_keys(segments, level)])
+    # predict one segment at a time
+    for key in np.unique(chosen):
+        rows = chosen == key
+        preds[rows] = lookup[key].predict(X[rows])
+
+    return preds
+
 # --------------------- Model Creation Functions --------------------- #
 
 def regression_bl(y_train, y_validate):
@@ -69,10 +270,8 @@ def ols_predictor(X_train, y_train, X_validate, y_validate):
 
 def lars_predictor(X_train, y_train, X_validate, y_validate):
     """ Create LASSO+LARS models, add predictions to y dataframes """
-    # Set hyperparameters
-    alpha_list = [.0001, .001, .01, .1, 1, 10, 100, 1000]
     # Iterate through each hyperparameter
-    for alpha in alpha_list:
+    for alpha in ALPHA_LIST:
         name = 'lars_' + str(alpha) # Generate model name
         # Build, fit, and predict all in one go
         y_train[name + '_preds'] = LassoLars(alpha=alpha).fit(X_train, y_train.actuals).predict(X_train)
@@ -82,12 +281,9 @@ def lars_predictor(X_train, y_train, X_validate, y_validate):
 
 def glm_predictor(X_train, y_train, X_validate, y_validate):
     """ Create GLM models, add predictions to y dataframes """
-    # Set hyperparameters
-    alpha_list = [.0001, .001, .01, .1, 1, 10, 100, 1000]
-    power_list = [0,1,2,3]
     # Iterate through each hyperparameter combination
-    for power in power_list:
-        for alpha in alpha_list:
+    for power in POWER_LIST:
+        for alpha in ALPHA_LIST:
             name = 'glm_' + 'p' + str(power) + 'a' + str(alpha) # Generate model name
             # Build, fit, and predict all in one go
             y_train[name + '_preds'] = TweedieRegressor(power=power, alpha=alpha).fit(X_train,y_train.actuals).predict(X_train)
@@ -97,9 +293,8 @@ def glm_predictor(X_train, y_train, X_validate, y_validate):
             
 def pf_lm_predictor(X_train, y_train, X_validate, y_validate):
     """ Create Polynomial Regression models, add predictions to y dataframes """
-    # Set hyperparameters
-    degree_list = [2,3,4,5,6]
-    for degree in degree_list:
+    # Iterate through each hyperparameter
+    for degree in DEGREE_LIST:
         name = 'lm_pf_' + str(degree) # Generate model name
         lm = LinearRegression(normalize=True) # Create linear regression model
         # Create polynomial variables
@@ -111,6 +306,126 @@ def pf_lm_predictor(X_train, y_train, X_validate, y_validate):
         
     return y_train, y_validate
 
+# --------------------- Streaming Regression --------------------- #
+
+def stream_shotgun(chunks, scaler=None, epochs=5):
+    """
+        Train incremental linear and GLM-style models on the run-level feature
+        table without holding it in memory:
+        chunks is a function returning a fresh iterator of dataframes
+        (e.g. lambda: pd.read_csv('features.csv', chunksize=10_000))
+        with 'run', 'hp', and feature columns,
+        Fit the scaler with wrangle.stream_scaler if one isn't passed,
+        Update each model with partial_fit on every chunk's train rows,
+        Score train and validate with running accumulators,
+        Return a y_df_RMSE_r2-style dataframe.
+    """
+    # scale with running min/max
+    if scaler is None:
+        scaler = wrangle.stream_scaler(chunks)
+    models = stream_candidates()
+    # train models batch by batch, one pass over the data per epoch
+    y_sum, y_count = 0, 0
+    for epoch in range(epochs):
+        for chunk in chunks():
+            X_train, y_train, _, _, _, _ = wrangle.stream_split(chunk)
+            if not len(X_train):
+                continue
+            X_train = scaler.transform(X_train)
+            for lm in models.values():
+                lm.partial_fit(X_train, y_train)
+            # running train mean for the baseline, counted once
+            if epoch == 0:
+                y_sum, y_count = y_sum + y_train.sum(), y_count + len(y_train)
+    if not y_count:
+        raise ValueError('stream_shotgun: chunks contain no train-split rows')
+    # score every model in one more pass
+    names = ['train_mean_bl'] + list(models)
+    train_acc, validate_acc = stream_accumulators(names), stream_accumulators(names)
+    for chunk in chunks():
+        X_train, y_train, X_validate, y_validate, _, _ = wrangle.stream_split(chunk)
+        for X, y, acc in [(X_train, y_train, train_acc), (X_validate, y_validate, validate_acc)]:
+            if not len(X):
+                continue
+            X = scaler.transform(X)
+            preds = {name: lm.predict(X) for name, lm in models.items()}
+            preds['train_mean_bl'] = np.full(len(y), y_sum / y_count)
+            stream_update(acc, y.to_numpy(), preds)
+    if not validate_acc['n']:
+        raise ValueError('stream_shotgun: chunks contain no validate-split rows')
+    # organize results like y_df_RMSE_r2
+    running_df = pd.DataFrame(columns=['Model','Train_RMSE','Validate_RMSE','Train_r2','Validate_r2'])
+    for name in names:
+        rmse_train, r2_train = stream_RMSE_r2(train_acc, name)
+        rmse_validate, r2_validate = stream_RMSE_r2(validate_acc, name)
+        running_df = running_df.append({'Model':name,
+                                       'Train_RMSE': rmse_train, 'Validate_RMSE': rmse_validate,
+                                       'Train_r2': r2_train, 'Validate_r2': r2_validate},
+                                        ignore_index=True)
+    return running_df
+
+def stream_candidates():
+    """ Return a dict of model name to unfitted incremental regressor """
+    # OLS fit by stochastic gradient descent
+    candidates = {'sgd_ols_preds': SGDRegressor(penalty=None, random_state=1)}
+    # LASSO-style (l1) and GLM/ridge-style (l2) models over the shotgun alphas
+    for penalty in ['l1','l2']:
+        for alpha in ALPHA_LIST[:5]: # larger alphas shrink SGD models to the mean
+            name = 'sgd_' + penalty + '_' + str(alpha) + '_preds'
+            candidates[name] = SGDRegressor(penalty=penalty, alpha=alpha, random_state=1)
+    # Huber loss, robust to typo'd hp outliers
+    candidates['sgd_huber_preds'] = SGDRegressor(loss='huber', epsilon=25, random_state=1)
+
+    return candidates
+
+def stream_accumulators(names):
+    """ Return running sums needed for RMSE and r^2 without keeping predictions """
+    return {'n': 0, 'y_sum': 0., 'y_sq_sum': 0., 'sse': dict.fromkeys(names, 0.)}
+
+def stream_update(acc, y, preds):
+    """ Add one batch of actuals and each model's predictions to the running sums """
+    acc['n'] += len(y)
+    acc['y_sum'] += y.sum()
+    acc['y_sq_sum'] += (y ** 2).sum()
+    for name, yhat in preds.items():
+        acc['sse'][name] += ((y - yhat) ** 2).sum()
+
+def stream_RMSE_r2(acc, name):
+    """ Calculate RMSE and r^2 score for one model from running sums (r^2 is nan for constant actuals) """
+    tss = acc['y_sq_sum'] - acc['y_sum'] ** 2 / acc['n']
+    rmse = (acc['sse'][name] / acc['n']) ** 0.5
+    r2 = 1 - acc['sse'][name] / tss if tss > 0 else np.nan
+
+    return rmse, r2
+
+def stream_vs_shotgun(chunks, epochs=5):
+    """
+        Compare stream_shotgun against the in-memory regression_shotgun on the
+        same rows: split every chunk with wrangle.stream_split, collect the train
+        and validate rows in memory for regression_shotgun, scale both with the
+        same streamed scaler, return both results stacked, best validate r^2 first.
+        Both sides use the same baseline, 'train_mean_bl': the train mean.
+        The in-memory side needs the train and validate splits to fit in RAM.
+    """
+    # one scaler for both modes
+    scaler = wrangle.stream_scaler(chunks)
+    stream_df = stream_shotgun(chunks, scaler=scaler, epochs=epochs)
+    # in-memory baseline on the same hashed split
+    splits = [wrangle.stream_split(chunk)[:4] for chunk in chunks()]
+    X_train = scaler.transform(pd.concat([split[0] for split in splits]))
+    X_validate = scaler.transform(pd.concat([split[2] for split in splits]))
+    y_train = pd.DataFrame({'actuals': pd.concat([split[1] for split in splits]).to_numpy()})
+    y_validate = pd.DataFrame({'actuals': pd.concat([split[3] for split in splits]).to_numpy()})
+    y_train, y_validate = regression_shotgun(X_train, y_train, X_validate, y_validate)
+    # swap regression_bl's per-split mean/median for the stream's train-mean baseline
+    y_train, y_validate = y_train.drop(columns=['mean_bl','median_bl']), y_validate.drop(columns=['mean_bl','median_bl'])
+    y_train.insert(1, 'train_mean_bl', y_train.actuals.mean())
+    y_validate.insert(1, 'train_mean_bl', y_train.actuals.mean())
+    shotgun_df = y_df_RMSE_r2(y_train, y_validate)
+
+    return pd.concat([stream_df.assign(Mode='stream'), shotgun_df.assign(Mode='in_memory')])\
+        .sort_values(by='Validate_r2', ascending=False).reset_index(drop=True)
+
 # --------------------- Additional Evaluation Functions --------------------- #
 
 def plot_residuals(x, y_train):
@@ -38,7 +38,7 @@ def prep_explore():
     # return only the train split for exploration
     return info_train, runs_train
 
-def prep_model():
+def prep_model(segments=False):
     """
         Ingest car_info.csv and dyno_runs.csv,
         Clean both files while preserving shared key 'Run',
@@ -49,6 +49,8 @@ def prep_model():
         Split car_info into train (50%), validate (30%), and test (20%) splits,
         Isolate target from splits,
         Return all data.
+        With segments=True, also isolate 'car_make' and 'car_model' from splits
+        and return them after the data (for model.segment_shotgun).
     """
     # car_info.csv
     info = prep_car_info()
@@ -67,12 +69,19 @@ def prep_model():
     max_hp_groupby = pd.DataFrame(runs.groupby('run').hp.max())
     info = pd.merge(left=info, right=max_hp_groupby, left_on='run', right_on='run')
     # shorten the dataframe to our MVP features, drop nulls (we may impute later)
-    info = info[['hp','stock_hp','psi','octane']] # dropping tuned_cpu based on exploration
+    segment_cols = ['car_make','car_model'] if segments else []
+    info = info[['hp','stock_hp','psi','octane'] + segment_cols] # dropping tuned_cpu based on exploration
     # split car_info.csv into train (50%), validate (30%), and test (20%)
     X_train, y_train, X_validate, y_validate, X_test, y_test = split_isolate_info(info)
+    # isolate segment columns from features
+    seg_train, seg_validate, seg_test = X_train[segment_cols], X_validate[segment_cols], X_test[segment_cols]
+    X_train, X_validate, X_test = X_train.drop(columns=segment_cols), \
+        X_validate.drop(columns=segment_cols), X_test.drop(columns=segment_cols)
     # scale splits
     X_train, X_validate, X_test = scaler(X_train, X_validate, X_test)
 
+    if segments:
+        return X_train, y_train, X_validate, y_validate, X_test, y_test, seg_train, seg_validate, seg_test
     return X_train, y_train, X_validate, y_validate, X_test, y_test
 
 def prep_explore_MVP():
@@ -237,6 +246,42 @@ def scaler(X_train, X_validate, X_test):
 
     return X_train, X_validate, X_test
 
+# --------------------- Streaming Functions --------------------- #
+
+def stream_split(chunk):
+    """
+        Split one chunk of the run-level feature table into train (50%),
+        validate (30%), and test (20%) using a hash of 'run', so every pass
+        over the data puts each run in the same split,
+        Isolate target from each split,
+        Return all data.
+    """
+    # stable bucket 0-9 for each run
+    bucket = pd.util.hash_pandas_object(chunk.run, index=False).to_numpy() % 10
+    train, validate, test = chunk[bucket < 5], chunk[(bucket >= 5) & (bucket < 8)], chunk[bucket >= 8]
+    # isolate target from each split, drop the run key
+    X_train, y_train = train.drop(columns=['hp','run']), train.hp
+    X_validate, y_validate = validate.drop(columns=['hp','run']), validate.hp
+    X_test, y_test = test.drop(columns=['hp','run']), test.hp
+
+    return X_train, y_train, X_validate, y_validate, X_test, y_test
+
+def stream_scaler(chunks):
+    """
+        Fit MinMaxScaler one chunk at a time with partial_fit,
+        Only train-split rows update the scaler,
+        Return the fitted scaler.
+    """
+    # build scaler
+    scaler = MinMaxScaler()
+    # update running min/max with each chunk's train rows
+    for chunk in chunks():
+        X_train, _, _, _, _, _ = stream_split(chunk)
+        if len(X_train):
+            scaler.partial_fit(X_train)
+
+    return scaler
+
 # --------------------- Feature Engineering --------------------- #
 
 def keyword_features(info):
@@ -305,6 +350,19 @@ def stock_hp(info):
 
     return info
 
+def keyword_cluster_features(clusters, info_train, info_validate, info_test):
+    """ 
+        Add a count column for each keyword group proposed by an
+        explore.KeywordClusters to each split, return all three splits.
+        Fit clusters on info_train only: they are learned from hp, the target.
+    """
+    # count each run's specs tokens in each keyword cluster
+    info_train = pd.concat([info_train, clusters.transform(info_train)], axis=1)
+    info_validate = pd.concat([info_validate, clusters.transform(info_validate)], axis=1)
+    info_test = pd.concat([info_test, clusters.transform(info_test)], axis=1)
+
+    return info_train, info_validate, info_test
+
 def keyword_features_MVP(info):
     """ 
         Create psi and octane features for keywords in the 'specs' column,